@@ -1,15 +1,11 @@
-from flask import Flask, render_template, jsonify, request, Response, redirect
-from steam_login import ensure_login, check_login_status, create_driver, load_cookies, handle_login
-from download_replays import download_replays, DOWNLOAD_DIR
+from flask import Flask, render_template, jsonify, request, Response, redirect, send_file
+from demos import list_demos, load_stats
+from demo_storage import materialize, check_storage_mode
+from download_queue import DownloadBudget, PRIORITIES
 import threading
+import os
 import queue
 import time
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-import os
-import json
-from datetime import datetime
 
 app = Flask(__name__)
 
@@ -30,6 +26,12 @@ def update_status(message):
 @app.route('/')
 def index():
     """Main page - check login status and render appropriate view"""
+    # Selenium is imported here so the server starts without a browser stack
+    from steam_login import create_driver, load_cookies
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.by import By
+
     cookies = load_cookies()
     is_logged_in = False
     
@@ -68,6 +70,8 @@ def index():
 @app.route('/login')
 def login():
     """Handle Steam login"""
+    from steam_login import handle_login
+
     try:
         cookies = handle_login()
         if cookies:
@@ -80,16 +84,54 @@ def login():
 
 @app.route('/start-download', methods=['POST'])
 def start_download():
-    """Start the download process"""
+    """Start the download process
+
+    Accepts an optional JSON body with "priority" and "max_seconds",
+    "max_bytes" or "max_count" budgets.
+    """
     if download_status['is_running']:
         return jsonify({'error': 'Download already in progress'})
     
+    try:
+        check_storage_mode()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 500
+    
+    options = request.get_json(silent=True) or {}
+    if not isinstance(options, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    priority = options.get('priority', 'newest')
+    if priority not in PRIORITIES:
+        return jsonify({'error': f"Unknown priority: {priority}"}), 400
+    
+    limits = {}
+    for key, convert in (('max_seconds', float), ('max_bytes', int), ('max_count', int)):
+        value = options.get(key)
+        if value is None:
+            continue
+        try:
+            value = convert(value)
+        except (TypeError, ValueError):
+            value = None
+        # "not >= 0" also rejects NaN
+        if isinstance(options[key], bool) or value is None or not value >= 0:
+            return jsonify({'error': f"{key} must be a non-negative number"}), 400
+        limits[key] = value
+    
     def download_worker():
         download_status['is_running'] = True
         download_status['error'] = None
         try:
-            download_replays(status_callback=update_status)
-            update_status("Download completed successfully!")
+            # Imported here so the web UI starts without the download stack
+            from download_replays import download_replays
+            budget = DownloadBudget(**limits)
+            failures = download_replays(status_callback=update_status, priority=priority, budget=budget)
+            if failures:
+                error_msg = f"Download finished with {failures} failures"
+                download_status['error'] = error_msg
+                update_status(error_msg)
+            else:
+                update_status("Download completed successfully!")
         except Exception as e:
             error_msg = f"Error: {str(e)}"
             download_status['error'] = error_msg
@@ -130,23 +172,8 @@ def stream_status():
 @app.route('/demos')
 def get_demos():
     """Get list of downloaded demos"""
-    demos = []
     try:
-        for file in os.listdir(DOWNLOAD_DIR):
-            if file.endswith('.dem'):
-                file_path = os.path.join(DOWNLOAD_DIR, file)
-                stats_path = os.path.join(DOWNLOAD_DIR, file.replace('.dem', '.json'))
-                
-                # Get file creation time
-                creation_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                
-                demos.append({
-                    'name': file,
-                    'date': creation_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'has_stats': os.path.exists(stats_path)
-                })
-        
-        return jsonify({'demos': sorted(demos, key=lambda x: x['date'], reverse=True)})
+        return jsonify({'demos': list_demos()})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -154,16 +181,24 @@ def get_demos():
 def get_demo_stats(demo_name):
     """Get stats for a specific demo"""
     try:
-        stats_path = os.path.join(DOWNLOAD_DIR, demo_name.replace('.dem', '.json'))
-        if not os.path.exists(stats_path):
+        stats = load_stats(demo_name)
+        if stats is None:
             return jsonify({'error': 'Stats not found'}), 404
             
-        with open(stats_path, 'r') as f:
-            stats = json.load(f)
-            
         return jsonify({'stats': stats})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/demo-file/<demo_name>')
+def get_demo_file(demo_name):
+    """Serve a demo, expanding it from compressed storage if needed"""
+    try:
+        # send_file resolves relative paths against the app, not the working directory
+        return send_file(os.path.abspath(materialize(demo_name)), as_attachment=True, conditional=True)
+    except FileNotFoundError:
+        return jsonify({'error': 'Demo not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000) 
\ No newline at end of file
@@ -0,0 +1,182 @@
+import os
+import struct
+import shutil
+import tempfile
+import time
+from demos import DOWNLOAD_DIR
+
+# "plain" keeps decompressed .dem files, "zstd" keeps .dem.zst files and
+# expands them into CACHE_DIR when something needs the raw demo.
+STORAGE_MODES = ('plain', 'zstd')
+STORAGE_MODE = os.environ.get('DEMO_STORAGE', 'plain')
+CACHE_DIR = os.path.join(DOWNLOAD_DIR, '.cache')
+CACHE_MAX_BYTES = int(float(os.environ.get('DEMO_CACHE_MAX_GB', '10')) * 1024**3)
+ZSTD_LEVEL = 3
+FRAME_SIZE = 4 * 1024 * 1024  # Uncompressed bytes per independent zstd frame
+
+ZSTD_SUFFIX = '.zst'
+PART_SUFFIX = '.part'
+STALE_PART_SECONDS = 60 * 60  # Temp files older than this are left over from a crash
+
+# Seek table layout from the zstd seekable format spec
+SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC = 0x8F92EAB1
+FOOTER_SIZE = 9
+ENTRY_SIZE = 8
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd demo storage requires the 'zstandard' package (pip install zstandard)")
+    return zstandard
+
+def compressed_path(dem_path):
+    return dem_path + ZSTD_SUFFIX
+
+def demo_exists(dem_path):
+    """True if a demo is stored either decompressed or compressed"""
+    return os.path.exists(dem_path) or os.path.exists(compressed_path(dem_path))
+
+def _temp_path(final_path):
+    """Unique temp file next to final_path, so concurrent writers never collide"""
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(final_path) + '.',
+                                    suffix=PART_SUFFIX,
+                                    dir=os.path.dirname(final_path) or '.')
+    os.close(fd)
+    return tmp_path
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def write_seekable(source, zst_path):
+    """Compress a file object into independent frames followed by a seek table"""
+    cctx = _zstandard().ZstdCompressor(level=ZSTD_LEVEL, write_content_size=True)
+    entries = []
+    tmp_path = _temp_path(zst_path)
+    try:
+        with open(tmp_path, 'wb') as dest:
+            while True:
+                chunk = source.read(FRAME_SIZE)
+                if not chunk:
+                    break
+                frame = cctx.compress(chunk)
+                dest.write(frame)
+                entries.append((len(frame), len(chunk)))
+
+            table = b''.join(struct.pack('<II', c_size, d_size) for c_size, d_size in entries)
+            footer = struct.pack('<IBI', len(entries), 0, SEEKABLE_MAGIC)
+            dest.write(struct.pack('<II', SKIPPABLE_MAGIC, len(table) + len(footer)))
+            dest.write(table)
+            dest.write(footer)
+        os.replace(tmp_path, zst_path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+def read_seek_table(zst_path):
+    """Return [(compressed_size, decompressed_size), ...] for each frame"""
+    with open(zst_path, 'rb') as f:
+        f.seek(-FOOTER_SIZE, os.SEEK_END)
+        num_frames, descriptor, magic = struct.unpack('<IBI', f.read(FOOTER_SIZE))
+        if magic != SEEKABLE_MAGIC:
+            raise ValueError(f"{zst_path} has no zstd seek table")
+        entry_size = ENTRY_SIZE + (4 if descriptor & 0x80 else 0)
+        f.seek(-(FOOTER_SIZE + num_frames * entry_size), os.SEEK_END)
+        table = f.read(num_frames * entry_size)
+    return [struct.unpack_from('<II', table, i * entry_size) for i in range(num_frames)]
+
+def decompressed_size(zst_path):
+    return sum(d_size for _, d_size in read_seek_table(zst_path))
+
+def extract(zst_path, dem_path):
+    """Expand a seekable .dem.zst file back into a plain demo"""
+    dctx = _zstandard().ZstdDecompressor()
+    tmp_path = _temp_path(dem_path)
+    try:
+        with open(zst_path, 'rb') as source, open(tmp_path, 'wb') as dest:
+            for c_size, d_size in read_seek_table(zst_path):
+                dest.write(dctx.decompress(source.read(c_size), max_output_size=d_size))
+        os.replace(tmp_path, dem_path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+def check_storage_mode():
+    """Reject a mistyped DEMO_STORAGE before anything gets written"""
+    if STORAGE_MODE not in STORAGE_MODES:
+        raise ValueError(f"Unknown DEMO_STORAGE {STORAGE_MODE!r}, expected one of {', '.join(STORAGE_MODES)}")
+
+def store_demo(source, dem_path):
+    """Write a decompressed demo stream using the configured storage mode"""
+    check_storage_mode()
+    if STORAGE_MODE == 'zstd':
+        write_seekable(source, compressed_path(dem_path))
+    else:
+        with open(dem_path, 'wb') as dest:
+            shutil.copyfileobj(source, dest)
+
+def prune_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """Delete least recently used cached demos until the cache fits"""
+    if not os.path.isdir(cache_dir):
+        return
+    files = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith(PART_SUFFIX) and os.path.isfile(path):
+            # Recent temp files may belong to an extraction still in progress
+            if time.time() - os.path.getmtime(path) > STALE_PART_SECONDS:
+                _remove_quietly(path)
+        elif name.endswith('.dem') and os.path.isfile(path):
+            st = os.stat(path)
+            files.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+def materialize(demo_name, download_dir=DOWNLOAD_DIR, cache_dir=CACHE_DIR):
+    """Return a path to the decompressed demo, expanding it into the cache if needed"""
+    # Only bare .dem names, so callers can't reach other files under download_dir
+    if not demo_name.endswith('.dem') or os.path.basename(demo_name) != demo_name or demo_name.startswith('.'):
+        raise FileNotFoundError(f"Demo not found: {demo_name}")
+
+    dem_path = os.path.join(download_dir, demo_name)
+    if os.path.exists(dem_path):
+        return dem_path
+
+    zst_path = compressed_path(dem_path)
+    if not os.path.exists(zst_path):
+        raise FileNotFoundError(f"Demo not found: {demo_name}")
+
+    cached_path = os.path.join(cache_dir, demo_name)
+    if os.path.exists(cached_path):
+        # Bump the mtime so LRU eviction keeps recently used demos
+        os.utime(cached_path)
+        return cached_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    extract(zst_path, cached_path)
+    prune_cache(cache_dir, max(CACHE_MAX_BYTES, os.path.getsize(cached_path)))
+    return cached_path
+
+def compact(download_dir=DOWNLOAD_DIR):
+    """Re-compress existing plain demos into .dem.zst, returning how many were converted"""
+    converted = 0
+    for name in os.listdir(download_dir):
+        if not name.endswith('.dem'):
+            continue
+        dem_path = os.path.join(download_dir, name)
+        with open(dem_path, 'rb') as source:
+            write_seekable(source, compressed_path(dem_path))
+        # Keep the original timestamps so the catalog date doesn't change
+        shutil.copystat(dem_path, compressed_path(dem_path))
+        os.remove(dem_path)
+        converted += 1
+    return converted
@@ -0,0 +1,49 @@
+import os
+import json
+from datetime import datetime
+
+DOWNLOAD_DIR = "replays"
+
+def stats_path_for(demo_name, download_dir=DOWNLOAD_DIR):
+    """Path of the stats JSON saved alongside a demo"""
+    return os.path.join(download_dir, demo_name.replace('.dem', '.json'))
+
+def list_demos(download_dir=DOWNLOAD_DIR):
+    """List downloaded demos, newest first"""
+    from demo_storage import ZSTD_SUFFIX, decompressed_size
+
+    demos = {}
+    if not os.path.isdir(download_dir):
+        return []
+
+    for file in os.listdir(download_dir):
+        if file.endswith('.dem') or file.endswith('.dem' + ZSTD_SUFFIX):
+            file_path = os.path.join(download_dir, file)
+            is_compressed = file.endswith(ZSTD_SUFFIX)
+            name = file[:-len(ZSTD_SUFFIX)] if is_compressed else file
+            if name in demos and not is_compressed:
+                continue
+
+            # Modification time survives `compact`, unlike the creation time
+            creation_time = datetime.fromtimestamp(os.path.getmtime(file_path))
+            stored_size = os.path.getsize(file_path)
+
+            demos[name] = {
+                'name': name,
+                'date': creation_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'has_stats': os.path.exists(stats_path_for(name, download_dir)),
+                'compressed': is_compressed,
+                'size': decompressed_size(file_path) if is_compressed else stored_size,
+                'stored_size': stored_size
+            }
+
+    return sorted(demos.values(), key=lambda x: x['date'], reverse=True)
+
+def load_stats(demo_name, download_dir=DOWNLOAD_DIR):
+    """Load saved player stats for a demo, or None if there are none"""
+    stats_path = stats_path_for(demo_name, download_dir)
+    if not os.path.exists(stats_path):
+        return None
+
+    with open(stats_path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+from demos import DOWNLOAD_DIR
+
+QUEUE_FILE = os.path.join(DOWNLOAD_DIR, 'download_queue.json')
+PINS_FILE_NAME = 'download_pins.json'  # Kept next to the queue file
+PRIORITIES = ('newest', 'smallest')
+MAX_ATTEMPTS = 3  # Drop a replay from the queue after failing in this many runs
+
+def match_key(name):
+    """Normalise a replay file name or URL to the match part, e.g. 003xxx_yyy"""
+    return name.split('/')[-1].split('.dem')[0]
+
+class DownloadBudget:
+    """Limits how much a single run downloads; None means unlimited"""
+
+    def __init__(self, max_seconds=None, max_bytes=None, max_count=None):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.started = time.monotonic()
+        self.bytes_used = 0
+        self.count = 0
+
+    def charge(self, size):
+        self.bytes_used += size
+        self.count += 1
+
+    def exhausted(self):
+        if self.max_seconds is not None and time.monotonic() - self.started >= self.max_seconds:
+            return True
+        if self.max_bytes is not None and self.bytes_used >= self.max_bytes:
+            return True
+        if self.max_count is not None and self.count >= self.max_count:
+            return True
+        return False
+
+class DownloadQueue:
+    """Replays waiting to be downloaded, persisted between runs
+
+    Pins live in their own file that only pin()/unpin() write, so a running
+    sync saving the queue never overwrites a pin added meanwhile.
+    """
+
+    def __init__(self, path=QUEUE_FILE):
+        self.path = path
+        self.pins_path = os.path.join(os.path.dirname(path), PINS_FILE_NAME)
+        self.entries = {}
+        self.dropped = set()  # Replays that failed too often; rescrapes don't re-queue them
+        self.pinned = set()
+        self.next_seq = 0
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.entries = {entry['filename']: entry for entry in data.get('entries', [])}
+            self.dropped = set(data.get('dropped', []))
+            self.next_seq = max((entry['seq'] for entry in self.entries.values()), default=-1) + 1
+        self.reload_pins()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, url, filename, played_at=None, stats=None):
+        """Queue a replay, returning False if it is already queued or was dropped"""
+        if filename in self.entries or filename in self.dropped:
+            return False
+        self.entries[filename] = {
+            'url': url,
+            'filename': filename,
+            'played_at': played_at,
+            'stats': stats,
+            'size': None,
+            'attempts': 0,
+            'seq': self.next_seq
+        }
+        self.next_seq += 1
+        return True
+
+    def remove(self, filename):
+        self.entries.pop(filename, None)
+
+    def record_failure(self, filename):
+        """Count a failed download, dropping the replay once it has failed too often"""
+        entry = self.entries[filename]
+        entry['attempts'] += 1
+        if entry['attempts'] >= MAX_ATTEMPTS:
+            self.remove(filename)
+            self.dropped.add(filename)
+
+    def reload_pins(self):
+        """Pick up pins written by another process since the queue was loaded"""
+        if os.path.exists(self.pins_path):
+            with open(self.pins_path, 'r') as f:
+                self.pinned = set(json.load(f))
+        else:
+            self.pinned = set()
+
+    def pin(self, name):
+        """Pin a match so it downloads before anything else, even if not queued yet"""
+        self.reload_pins()
+        self.pinned.add(match_key(name))
+        self._write_json(self.pins_path, sorted(self.pinned))
+
+    def unpin(self, name):
+        self.reload_pins()
+        self.pinned.discard(match_key(name))
+        self._write_json(self.pins_path, sorted(self.pinned))
+
+    def is_pinned(self, entry):
+        return match_key(entry['filename']) in self.pinned
+
+    def ordered(self, priority='newest'):
+        """Queued entries in download order: pinned first, then by priority"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {', '.join(PRIORITIES)}")
+
+        # Stable sorts applied from the least to the most significant key;
+        # seq keeps Steam's page order (newest first) as the final tie-break
+        entries = sorted(self.entries.values(), key=lambda entry: entry['seq'])
+        if priority == 'smallest':
+            entries.sort(key=lambda entry: (entry['size'] is None, entry['size'] or 0))
+        else:
+            # Dates are "YYYY-MM-DD HH:MM:SS" strings, so they sort chronologically
+            entries.sort(key=lambda entry: entry['played_at'] or '', reverse=True)
+        entries.sort(key=lambda entry: not self.is_pinned(entry))
+        return entries
+
+    def save(self):
+        self._write_json(self.path, {
+            'entries': list(self.entries.values()),
+            'dropped': sorted(self.dropped)
+        })
+
+    @staticmethod
+    def _write_json(path, data):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.part'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, path)
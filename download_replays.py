@@ -1,24 +1,20 @@
-from steam_login import load_cookies, create_driver, ensure_login, verify_login
+from steam_login import load_cookies, create_driver, ensure_login, verify_login, LoginRequiredError
+from demos import DOWNLOAD_DIR
+from demo_storage import store_demo, demo_exists
+from download_queue import DownloadQueue, DownloadBudget
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import time
 import os
-import asyncio
-import aiohttp
-from aiohttp import ClientTimeout
-from tqdm import tqdm
 import json
-from bs4 import BeautifulSoup
 import traceback
 import requests
 import bz2
-import shutil
+import re
 
 MATCH_HISTORY_URL = "https://steamcommunity.com/my/gcpd/730?tab=matchhistorypremier"
-DOWNLOAD_DIR = "replays"
-MAX_CONCURRENT_DOWNLOADS = 5  # Adjust this based on your internet connection
-TIMEOUT = ClientTimeout(total=300)  # 5 minutes timeout for each download
+MATCH_TIME_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
 
 def setup_driver(headless=True):
     """Setup Chrome driver with cookies"""
@@ -26,7 +22,7 @@ def setup_driver(headless=True):
     cookies = load_cookies()
     
     if not cookies:
-        raise Exception("No cookies found - login required")
+        raise LoginRequiredError("No cookies found - login required")
     
     # Visit Steam domain first (required for cookie setting)
     driver.get('https://steamcommunity.com')
@@ -40,59 +36,10 @@ def setup_driver(headless=True):
     
     # Verify login worked
     if not verify_login(driver):
-        raise Exception("Login verification failed")
+        raise LoginRequiredError("Login verification failed")
     
     return driver
 
-async def download_file(session, url, filepath, pbar):
-    if os.path.exists(filepath.replace('.bz2', '')):  # Check for existing .dem file
-        pbar.update(1)
-        return True
-
-    try:
-        async with session.get(url, timeout=TIMEOUT) as response:
-            if response.status == 200:
-                with open(filepath, 'wb') as f:
-                    while True:
-                        chunk = await response.content.read(8192)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                
-                # Decompress the file after successful download
-                if filepath.endswith('.bz2'):
-                    if decompress_bz2(filepath):
-                        print(f"Decompressed {filepath}")
-                    else:
-                        print(f"Failed to decompress {filepath}")
-                
-                pbar.update(1)
-                return True
-            else:
-                print(f"\nFailed to download {filepath}: Status code {response.status}")
-                return False
-    except Exception as e:
-        print(f"\nError downloading {filepath}: {str(e)}")
-        return False
-
-async def download_batch(urls_and_paths):
-    async with aiohttp.ClientSession() as session:
-        pbar = tqdm(total=len(urls_and_paths), desc="Downloading replays")
-        tasks = []
-        semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
-
-        async def download_with_semaphore(url, filepath):
-            async with semaphore:
-                return await download_file(session, url, filepath, pbar)
-
-        for url, filepath in urls_and_paths:
-            task = asyncio.ensure_future(download_with_semaphore(url, filepath))
-            tasks.append(task)
-
-        results = await asyncio.gather(*tasks)
-        pbar.close()
-        return results
-
 def extract_player_stats(driver, match_container):
     try:
         print("Extracting stats from match...")
@@ -172,12 +119,99 @@ def find_download_buttons(match_container):
         print(f"Error finding download buttons: {str(e)}")
         return []
 
-def get_download_links(driver, status_callback=None):
+def find_match_time(match_container):
+    """Read the "YYYY-MM-DD HH:MM:SS GMT" date shown next to a match, if any"""
+    try:
+        left_panel = match_container.find_element(By.CSS_SELECTOR, "td.val_left")
+        match = MATCH_TIME_PATTERN.search(left_panel.text)
+        return match.group(0) if match else None
+    except Exception as e:
+        print(f"Error finding match time: {str(e)}")
+        return None
+
+def fetch_replay_size(url):
+    """Ask the replay server for the compressed size without downloading"""
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=10)
+        response.raise_for_status()
+        return int(response.headers.get('content-length', 0)) or None
+    except Exception as e:
+        print(f"Could not get size of {url}: {str(e)}")
+        return None
+
+def drain_queue(download_queue, priority, budget, status_callback=None, attempted=None):
+    """Download queued replays in priority order until the queue or budget runs out
+
+    `attempted` holds replays already tried this run; pass the same set on
+    every call so a failing replay is tried only once per run. Returns the
+    number of replays that failed to download.
+    """
+    if priority == 'smallest':
+        # Sizes are only needed for ordering; the budget counts bytes actually downloaded
+        for entry in download_queue.entries.values():
+            if entry['size'] is None:
+                entry['size'] = fetch_replay_size(entry['url'])
+
+    if attempted is None:
+        attempted = set()
+    failures = 0
+    while True:
+        if budget.exhausted():
+            print(f"Download budget reached, {len(download_queue)} replays left queued")
+            break
+
+        # Re-read pins before every replay so `queue pin` takes effect mid-run
+        download_queue.reload_pins()
+        entry = next((entry for entry in download_queue.ordered(priority)
+                      if entry['filename'] not in attempted), None)
+        if entry is None:
+            break
+        attempted.add(entry['filename'])
+
+        filepath = os.path.join(DOWNLOAD_DIR, entry['filename'])
+        if status_callback:
+            status_callback(f"Downloading {entry['filename']} ({len(download_queue)} queued)")
+        downloaded = download_replay(entry['url'], filepath)
+        if downloaded is None:
+            print(f"Failed to download: {filepath}")
+            download_queue.record_failure(entry['filename'])
+            failures += 1
+        else:
+            if downloaded:
+                print(f"Successfully downloaded: {filepath}")
+                # Save stats to JSON with same name as replay
+                if entry['stats']:
+                    json_path = os.path.join(DOWNLOAD_DIR, entry['filename'].replace('.dem.bz2', '.json'))
+                    with open(json_path, 'w') as f:
+                        json.dump(entry['stats'], f, indent=4)
+                budget.charge(downloaded)
+            # 0 bytes means it was already stored (another sync, `compact`), so nothing is charged
+            download_queue.remove(entry['filename'])
+            if download_queue.is_pinned(entry):
+                download_queue.unpin(entry['filename'])
+
+        # Persist after every replay so an interrupted run loses nothing
+        download_queue.save()
+
+    return failures
+
+def get_download_links(driver, status_callback=None, download_queue=None, priority='newest', budget=None):
+    """Queue and download replays page by page
+
+    Returns the processed replay URLs and the number of failures (failed
+    downloads plus scrape errors that cut the run short).
+    """
     wait = WebDriverWait(driver, 10)
     processed_urls = set()  # Track processed URLs
     previous_matches_count = 0
     matches_without_download = 0  # Counter for matches without download button
     MAX_MATCHES_WITHOUT_DOWNLOAD = 3  # Stop after this many matches without download buttons
+    if download_queue is None:
+        download_queue = DownloadQueue()
+    if budget is None:
+        budget = DownloadBudget()
+    failures = 0
+    attempted = set()  # Replays tried this run, so each fails at most once per run
     
     while True:
         try:
@@ -193,8 +227,9 @@ def get_download_links(driver, status_callback=None):
                 break
                 
             previous_matches_count = current_matches_count
+            reached_old_matches = False
             
-            # Process each match container
+            # Queue the replays of each match container
             for i, container in enumerate(match_containers):
                 try:
                     print(f"\nProcessing match {i+1}/{current_matches_count}")
@@ -208,17 +243,23 @@ def get_download_links(driver, status_callback=None):
                         if matches_without_download >= MAX_MATCHES_WITHOUT_DOWNLOAD:
                             print(f"\nFound {matches_without_download} consecutive matches without downloads.")
                             print("Matches are too old, stopping processing...")
-                            return processed_urls
+                            reached_old_matches = True
+                            break
                         continue
                     else:
                         matches_without_download = 0  # Reset counter if we find a download button
                     
+                    if all(url in processed_urls for url in download_links):
+                        print("Already processed this match")
+                        continue
+                    
                     # Extract player stats
                     stats = extract_player_stats(driver, container)
                     if stats:
                         print(f"Successfully extracted stats for {len(stats)} players")
+                    played_at = find_match_time(container)
                     
-                    # Process download links
+                    # Queue download links
                     for replay_url in download_links:
                         try:
                             if replay_url and ".dem" in replay_url and replay_url not in processed_urls:
@@ -228,19 +269,10 @@ def get_download_links(driver, status_callback=None):
                                 print(f"Found new replay URL: {replay_url}")
                                 processed_urls.add(replay_url)
                                 
-                                # Download the replay immediately
-                                if not os.path.exists(filepath):
-                                    if download_replay(replay_url, filepath):
-                                        print(f"Successfully downloaded: {filepath}")
-                                        # Save stats to JSON with same name as replay
-                                        if stats:
-                                            json_path = os.path.join(DOWNLOAD_DIR, filename.replace('.dem.bz2', '.json'))
-                                            with open(json_path, 'w') as f:
-                                                json.dump(stats, f, indent=4)
-                                    else:
-                                        print(f"Failed to download: {filepath}")
-                                else:
+                                if demo_exists(filepath.replace('.bz2', '')):
                                     print(f"Skipping {filepath} - already exists")
+                                elif download_queue.add(replay_url, filename, played_at, stats):
+                                    print(f"Queued {filename}")
                             else:
                                 print("Already processed this replay URL")
                         except Exception as e:
@@ -250,6 +282,13 @@ def get_download_links(driver, status_callback=None):
                     print(f"Error processing match container: {str(e)}")
                     continue
             
+            # Download what is queued so far before loading older matches, so
+            # the newest replays land without waiting behind the backfill
+            download_queue.save()
+            failures += drain_queue(download_queue, priority, budget, status_callback, attempted)
+            if reached_old_matches or budget.exhausted():
+                break
+            
             # Try to find and click "Load More" button
             try:
                 load_more = driver.find_element(By.ID, "load_more_button")
@@ -270,17 +309,17 @@ def get_download_links(driver, status_callback=None):
                 
         except Exception as e:
             print(f"Error in main loop: {str(e)}")
+            failures += 1
             break
             
-    return processed_urls
+    return processed_urls, failures
 
 def decompress_bz2(bz2_path):
-    """Decompress a .bz2 file and remove the original compressed file"""
+    """Decompress a .bz2 file into demo storage and remove the original compressed file"""
     dem_path = bz2_path.replace('.bz2', '')
     try:
         with bz2.BZ2File(bz2_path, 'rb') as source:
-            with open(dem_path, 'wb') as dest:
-                shutil.copyfileobj(source, dest)
+            store_demo(source, dem_path)
         # Remove the original .bz2 file
         os.remove(bz2_path)
         print(f"Successfully decompressed: {dem_path}")
@@ -290,16 +329,20 @@ def decompress_bz2(bz2_path):
         return False
 
 def download_replay(url, filepath):
-    """Download a single replay file"""
+    """Download a single replay file
+
+    Returns the number of bytes downloaded (0 if the demo already exists),
+    or None if the download failed.
+    """
     try:
         print(f"\nStarting download of {url}")
         print(f"Saving to: {filepath}")
         
         # Check if decompressed file already exists
         dem_path = filepath.replace('.bz2', '')
-        if os.path.exists(dem_path):
+        if demo_exists(dem_path):
             print(f"Decompressed file already exists: {dem_path}")
-            return True
+            return 0
         
         # Add headers to mimic browser request
         headers = {
@@ -337,26 +380,31 @@ def download_replay(url, filepath):
         if filepath.endswith('.bz2'):
             if decompress_bz2(filepath):
                 print(f"Successfully decompressed {filepath}")
-                return True
+                return downloaded
             else:
                 print(f"Failed to decompress {filepath}")
-                return False
+                return None
         
-        return True
+        return downloaded
         
     except requests.exceptions.RequestException as e:
         print(f"Network error during download: {str(e)}")
         if os.path.exists(filepath):
             os.remove(filepath)  # Clean up partial download
-        return False
+        return None
     except Exception as e:
         print(f"Error downloading replay: {str(e)}")
         if os.path.exists(filepath):
             os.remove(filepath)  # Clean up partial download
-        return False
+        return None
+
+def download_replays(status_callback=None, priority='newest', budget=None):
+    """Main function to download CS:GO replays
 
-def download_replays(status_callback=None):
-    """Main function to download CS:GO replays"""
+    Replays are queued in DOWNLOAD_DIR/download_queue.json and downloaded in
+    priority order; anything left when the budget runs out stays queued for
+    the next run. Returns the number of failures during the run.
+    """
     try:
         # Create downloads directory
         os.makedirs(DOWNLOAD_DIR, exist_ok=True)
@@ -378,12 +426,15 @@ def download_replays(status_callback=None):
                 EC.presence_of_element_located((By.CSS_SELECTOR, "table.csgo_scoreboard_root"))
             )
             
-            processed_urls = get_download_links(driver, status_callback)
+            download_queue = DownloadQueue()
+            processed_urls, failures = get_download_links(driver, status_callback, download_queue, priority, budget)
             if status_callback:
-                status_callback(f"Finished processing {len(processed_urls)} matches")
+                status_callback(f"Finished processing {len(processed_urls)} matches, {len(download_queue)} replays still queued, {failures} failures")
             
         finally:
             driver.quit()
+        
+        return failures
             
     except Exception as e:
         error_msg = f"Error in download_replays: {str(e)}"
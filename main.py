@@ -1,28 +1,288 @@
-from steam_login import ensure_login
-from download_replays import download_replays
-import time
+import argparse
+import json
+import os
+import sys
+from demos import DOWNLOAD_DIR
+from download_queue import DownloadQueue, DownloadBudget, PRIORITIES, QUEUE_FILE
+
+# Heavy dependencies (selenium, requests, Flask) are imported inside
+# the commands that use them so `list` and `stats` start instantly.
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_LOGIN_REQUIRED = 3
+EXIT_INTERRUPTED = 130  # Conventional exit code for Ctrl-C
+
+EXIT_CODES_HELP = """exit codes:
+  0    success
+  1    error
+  2    invalid command line
+  3    Steam login required (run `login`)
+  130  interrupted"""
+
+def non_negative(convert):
+    """argparse type that rejects negative budgets, like /start-download does"""
+    def parse(text):
+        try:
+            value = convert(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid number: {text!r}")
+        # "not >= 0" also rejects NaN
+        if not value >= 0:
+            raise argparse.ArgumentTypeError(f"must be non-negative: {text!r}")
+        return value
+    return parse
+
+def cmd_login(args):
+    """Open a browser window and save fresh Steam cookies"""
+    from steam_login import handle_login
+
+    if not handle_login():
+        print("Login failed", file=sys.stderr)
+        return EXIT_ERROR
+    return EXIT_OK
+
+def cmd_verify(args):
+    """Check the saved cookies against Steam in a headless browser"""
+    from steam_login import load_cookies, create_driver, verify_login
+
+    cookies = load_cookies()
+    if not cookies:
+        print("No saved cookies - run `login` first", file=sys.stderr)
+        return EXIT_LOGIN_REQUIRED
+
+    driver = create_driver(headless=True)
+    try:
+        driver.get('https://steamcommunity.com')
+        for cookie in cookies:
+            driver.add_cookie(cookie)
+        is_valid = verify_login(driver)
+    finally:
+        driver.quit()
+
+    if not is_valid:
+        print("Saved login is no longer valid - run `login` again", file=sys.stderr)
+        return EXIT_LOGIN_REQUIRED
+    print("Existing login is valid")
+    return EXIT_OK
+
+def cmd_sync(args):
+    """Download new replays without ever prompting"""
+    from demo_storage import check_storage_mode
+
+    try:
+        check_storage_mode()
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_ERROR
+
+    from steam_login import load_cookies, LoginRequiredError
+
+    if not load_cookies():
+        print("No saved cookies - run `login` first", file=sys.stderr)
+        return EXIT_LOGIN_REQUIRED
+
+    from download_replays import download_replays
+
+    budget = DownloadBudget(
+        max_seconds=args.max_minutes * 60 if args.max_minutes is not None else None,
+        max_bytes=int(args.max_mb * 1024**2) if args.max_mb is not None else None,
+        max_count=args.max_count
+    )
+    try:
+        failures = download_replays(priority=args.priority, budget=budget)
+    except LoginRequiredError as e:
+        print(f"Sync failed: {str(e)} - run `login` again", file=sys.stderr)
+        return EXIT_LOGIN_REQUIRED
+    except Exception as e:
+        print(f"Sync failed: {str(e)}", file=sys.stderr)
+        return EXIT_ERROR
+    if failures:
+        print(f"Sync finished with {failures} failures", file=sys.stderr)
+        return EXIT_ERROR
+    return EXIT_OK
+
+def cmd_queue(args):
+    """Show the download queue or pin/unpin matches in it"""
+    download_queue = DownloadQueue(os.path.join(args.dir, os.path.basename(QUEUE_FILE)))
+    if args.action in ('pin', 'unpin'):
+        if not args.names:
+            print(f"Give at least one match to {args.action}", file=sys.stderr)
+            return EXIT_ERROR
+        for name in args.names:
+            if args.action == 'pin':
+                download_queue.pin(name)
+            else:
+                download_queue.unpin(name)
+        return EXIT_OK
+
+    for entry in download_queue.ordered(args.priority):
+        marker = '!' if download_queue.is_pinned(entry) else ' '
+        size = f"{entry['size'] / 1024**2:.1f} MB" if entry['size'] else '?'
+        print(f"{entry['played_at'] or 'unknown date':19}  {marker} {entry['filename']}  {size}")
+    return EXIT_OK
+
+def cmd_list(args):
+    """Print the downloaded demos"""
+    from demos import list_demos
+
+    demos = list_demos(args.dir)
+    if args.json:
+        print(json.dumps(demos, indent=4))
+        return EXIT_OK
+
+    for demo in demos:
+        marker = '*' if demo['has_stats'] else ' '
+        sizes = f"{demo['stored_size'] / 1024**2:8.1f} MB"
+        if demo['compressed']:
+            sizes += f" ({demo['size'] / 1024**2:.1f} MB raw)"
+        print(f"{demo['date']}  {marker} {demo['name']}  {sizes}")
+    return EXIT_OK
+
+def cmd_stats(args):
+    """Print player stats for one demo, or a summary of all of them"""
+    from demos import list_demos, load_stats
+
+    if args.demo:
+        stats = load_stats(args.demo, args.dir)
+        if stats is None:
+            print(f"Stats not found for {args.demo}", file=sys.stderr)
+            return EXIT_ERROR
+        print(json.dumps(stats, indent=4))
+        return EXIT_OK
+
+    demos = list_demos(args.dir)
+    with_stats = sum(1 for demo in demos if demo['has_stats'])
+    print(f"Demos: {len(demos)}")
+    print(f"With stats: {with_stats}")
+    print(f"Stored: {sum(demo['stored_size'] for demo in demos) / 1024**2:.1f} MB "
+          f"({sum(demo['size'] for demo in demos) / 1024**2:.1f} MB raw)")
+    if demos:
+        print(f"Newest: {demos[0]['date']}  {demos[0]['name']}")
+    return EXIT_OK
+
+def cmd_path(args):
+    """Print a path to the decompressed demo, expanding it from storage if needed"""
+    from demo_storage import materialize
+
+    try:
+        print(materialize(args.demo, args.dir, os.path.join(args.dir, '.cache')))
+    except (OSError, RuntimeError) as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_ERROR
+    return EXIT_OK
+
+def cmd_compact(args):
+    """Re-compress existing plain demos into zstd storage"""
+    from demo_storage import compact
+
+    try:
+        converted = compact(args.dir)
+    except (OSError, RuntimeError) as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_ERROR
+    print(f"Compressed {converted} demos")
+    return EXIT_OK
+
+def cmd_serve(args):
+    """Run the web UI"""
+    from app import app
+
+    app.run(host=args.host, port=args.port, debug=args.debug)
+    return EXIT_OK
+
+def cmd_default(args):
+    """Interactive flow: log in if needed, then download everything"""
+    from steam_login import ensure_login
+    from download_replays import download_replays
+    from demo_storage import check_storage_mode
+    import time
 
-def main():
     try:
         print("Starting CS:GO replay downloader...")
-        
+        check_storage_mode()
+
         # First ensure we have valid login
         print("\nChecking login status...")
         ensure_login()
-        
+
         # Small delay to ensure cookies are saved
         time.sleep(2)
-        
+
         # Then download replays
         print("\nStarting replay download process...")
-        download_replays()
-        
+        failures = download_replays()
+
     except Exception as e:
         print(f"\nApplication error: {str(e)}")
-        input("\nPress Enter to exit...")
-    else:
-        print("\nDownload process completed successfully!")
-        input("\nPress Enter to exit...")
+        return EXIT_ERROR
+    if failures:
+        print(f"\nDownload process finished with {failures} failures")
+        return EXIT_ERROR
+    print("\nDownload process completed successfully!")
+    return EXIT_OK
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="CS2 replay downloader",
+                                     epilog=EXIT_CODES_HELP,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.set_defaults(func=cmd_default)
+    subparsers = parser.add_subparsers(dest='command')
+
+    login_parser = subparsers.add_parser('login', help="log in to Steam in a browser window")
+    login_parser.set_defaults(func=cmd_login)
+
+    verify_parser = subparsers.add_parser('verify', help="check that the saved login is still valid")
+    verify_parser.set_defaults(func=cmd_verify)
+
+    sync_parser = subparsers.add_parser('sync', help="download new replays non-interactively")
+    sync_parser.add_argument('--priority', choices=PRIORITIES, default='newest',
+                             help="download order after pinned matches")
+    sync_parser.add_argument('--max-minutes', type=non_negative(float), help="stop starting downloads after this long")
+    sync_parser.add_argument('--max-mb', type=non_negative(float), help="stop after downloading this many MB")
+    sync_parser.add_argument('--max-count', type=non_negative(int), help="stop after this many replays")
+    sync_parser.set_defaults(func=cmd_sync)
+
+    queue_parser = subparsers.add_parser('queue', help="show the download queue or pin matches")
+    queue_parser.add_argument('action', nargs='?', choices=('show', 'pin', 'unpin'), default='show')
+    queue_parser.add_argument('names', nargs='*', help="replay file names or match ids to pin/unpin")
+    queue_parser.add_argument('--priority', choices=PRIORITIES, default='newest')
+    queue_parser.add_argument('--dir', default=DOWNLOAD_DIR, help="replay directory")
+    queue_parser.set_defaults(func=cmd_queue)
+
+    list_parser = subparsers.add_parser('list', help="list downloaded demos")
+    list_parser.add_argument('--dir', default=DOWNLOAD_DIR, help="replay directory")
+    list_parser.add_argument('--json', action='store_true', help="print JSON instead of text")
+    list_parser.set_defaults(func=cmd_list)
+
+    stats_parser = subparsers.add_parser('stats', help="show player stats for a demo")
+    stats_parser.add_argument('demo', nargs='?', help="demo file name (omit for a summary)")
+    stats_parser.add_argument('--dir', default=DOWNLOAD_DIR, help="replay directory")
+    stats_parser.set_defaults(func=cmd_stats)
+
+    path_parser = subparsers.add_parser('path', help="print the path of a decompressed demo")
+    path_parser.add_argument('demo', help="demo file name")
+    path_parser.add_argument('--dir', default=DOWNLOAD_DIR, help="replay directory")
+    path_parser.set_defaults(func=cmd_path)
+
+    compact_parser = subparsers.add_parser('compact', help="re-compress plain demos with zstd")
+    compact_parser.add_argument('--dir', default=DOWNLOAD_DIR, help="replay directory")
+    compact_parser.set_defaults(func=cmd_compact)
+
+    serve_parser = subparsers.add_parser('serve', help="run the web UI")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=5000)
+    serve_parser.add_argument('--debug', action='store_true')
+    serve_parser.set_defaults(func=cmd_serve)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
@@ -10,6 +10,9 @@ import os
 COOKIE_FILE = 'steam_cookies.pkl'
 STEAM_LOGIN_URL = 'https://steamcommunity.com/login'
 
+class LoginRequiredError(Exception):
+    """Raised when there is no valid saved Steam session"""
+
 def create_driver(headless=False):
     options = Options()
     if headless: